@@ -1,18 +1,31 @@
-import chess.engine
 import chess
+from collections import deque
 from typing import Optional
 import logging
 
+# Marks a per-ply cache slot whose value may legitimately be None
+_NOT_COMPUTED = object()
+
 class GameState():
     board: chess.Board
     move_history: list[chess.Move]
     ai_color: chess.Color
     difficulty: int
+    _fen_cache: Optional[str]
+    _uci_history: deque[str]
+    _outcome_cache: object
 
     @property 
     def current_player(self) -> chess.Color:
         return self.board.turn
 
+    @property
+    def outcome(self) -> Optional[chess.Outcome]:
+        """Game outcome in the current position, evaluated once per ply"""
+        if self._outcome_cache is _NOT_COMPUTED:
+            self._outcome_cache = self.board.outcome()
+        return self._outcome_cache
+
     def __init__(self, ai_color: chess.Color, difficulty: int = 10, fen: str = None):
         try:
             self.board = chess.Board(fen) if fen else chess.Board()
@@ -21,21 +34,38 @@ class GameState():
         self.ai_color = ai_color
         self.difficulty = difficulty
         self.move_history = []
+        self._uci_history = deque()
+        self._fen_cache = None
+        self._outcome_cache = _NOT_COMPUTED
     
     def make_move(self, move: chess.Move):
         if not self.board.is_legal(move):
             raise ValueError(f"Invalid move: {move}")
         self.board.push(move)
         self.move_history.append(move)
+        self._uci_history.append(move.uci())
+        self._fen_cache = None
+        self._outcome_cache = _NOT_COMPUTED
 
     def game_status(self):
+        # FEN is only re-serialised after the position changes
+        if self._fen_cache is None:
+            self._fen_cache = self.board.fen()
+        # One outcome() call covers game over, checkmate and stalemate
+        outcome = self.outcome
+        termination = outcome.termination if outcome is not None else None
+        if termination in (None, chess.Termination.CHECKMATE, chess.Termination.STALEMATE):
+            is_stalemate = termination == chess.Termination.STALEMATE
+        else:
+            # outcome() reports insufficient material and the automatic draw rules before stalemate
+            is_stalemate = self.board.is_stalemate()
         return {
-            "fen": self.board.fen(),
+            "fen": self._fen_cache,
             "current_player": "white" if self.current_player == chess.WHITE else "black",
-            "move_history": [move.uci() for move in self.move_history],  # UCI strings
+            "move_history": list(self._uci_history),  # UCI strings
             "is_check": self.board.is_check(),
-            "is_checkmate": self.board.is_checkmate(),
-            "is_stalemate": self.board.is_stalemate(),
-            "is_game_over": self.board.is_game_over(),
+            "is_checkmate": termination == chess.Termination.CHECKMATE,
+            "is_stalemate": is_stalemate,
+            "is_game_over": outcome is not None,
             "ai_color": "white" if self.ai_color == chess.WHITE else "black"
-      }
\ No newline at end of file
+      }
@@ -1,5 +1,7 @@
 from mcp.server.fastmcp import FastMCP
 import chess
+import functools
+import re
 from game_state import GameState
 from stockfish_manager import StockfishManager as StockfishManager
 import logging
@@ -18,11 +20,67 @@ CHESS_API_BASE = 'https://chess-api.com/v1'
 def main():
     mcp.run()
 
+def _opening_fens() -> frozenset:
+    """The starting position and every position one move into the game"""
+    board = chess.Board()
+    fens = {board.fen()}
+    for move in board.legal_moves:
+        board.push(move)
+        fens.add(board.fen())
+        fens.add(board.fen(en_passant="fen"))
+        board.pop()
+    return frozenset(fens)
+
+# Opening positions are the most common input and need no parsing at all
+_KNOWN_VALID_FENS = _opening_fens()
+
+# Shape of a FEN as accepted by chess.Board: the position part, then optional
+# turn, castling, en passant and clock fields. Clocks are left to int().
+_FEN_RE = re.compile(
+    r"\s*[1-8pnbrqkPNBRQK~]+(?:/[1-8pnbrqkPNBRQK~]+){7}"
+    r"(?:\s+[wb](?:\s+(?:-|[KQA-H]{0,2}[kqa-h]{0,2})(?:\s+(?:-|[a-h][1-8])(?:\s+\S+){0,2})?)?)?\s*\Z"
+)
+
+# Squares covered by each byte of a board FEN: digits count as themselves,
+# piece letters as one square and the promoted marker "~" as none. Any other
+# byte maps to 9 so a rank containing it can never add up to 8.
+_RANK_SQUARES = bytes(
+    int(c) if c in "12345678" else 1 if c in "pnbrqkPNBRQK" else 0 if c == "~" else 9
+    for c in map(chr, range(256))
+)
+
+def _ranks_cover_board(board_fen: str) -> bool:
+    """Cheap pre-check that the position part has 8 ranks of 8 squares"""
+    ranks = board_fen.encode("ascii", "replace").split(b"/")
+    return len(ranks) == 8 and all(sum(rank.translate(_RANK_SQUARES)) == 8 for rank in ranks)
+
+@functools.lru_cache(maxsize=256)
+def _board_from_fen(fen: str) -> chess.Board:
+    """Parse a FEN once; callers that hand the board on must copy it"""
+    parts = fen.split(maxsplit=1)
+    if not parts or not _ranks_cover_board(parts[0]):
+        raise ValueError(f"expected 8 ranks of 8 squares in position part of fen: {fen!r}")
+    return chess.Board(fen)
+
+# Parsed moves by UCI string. Only a few tens of thousands of strings parse
+# as moves at all, so the cache stays small
+_MOVE_CACHE: dict[str, chess.Move] = {}
+
+def _move_from_uci(uci: str) -> chess.Move:
+    move = _MOVE_CACHE.get(uci)
+    if move is None:
+        move = _MOVE_CACHE[uci] = chess.Move.from_uci(uci)
+    return move
+
 @mcp.tool()
 def fen_validator(fen: str) -> bool:
     """Validate a FEN string for a chess game"""
+    if fen in _KNOWN_VALID_FENS:
+        return True
+    if not _FEN_RE.match(fen):
+        return False
     try:
-        chess.Board(fen)
+        _board_from_fen(fen)
         return True
     except ValueError:
         return False
@@ -30,10 +88,12 @@ def fen_validator(fen: str) -> bool:
 # Stockfish tools
 
 @mcp.tool()
-def analyze_position(fen: str):
-    """Analyze a chess position"""
-    board  = chess.Board(fen)
-    analysis = stockfish_manager.analyze_position(board)
+def analyze_position(fen: str, min_depth: int = None, max_time: float = None, time_limit_s: float = None):
+    """Analyze a chess position. With max_time (seconds), return early once a line of min_depth is found; min_depth requires max_time"""
+    board = _board_from_fen(fen).copy(stack=False)
+    analysis = stockfish_manager.analyze_position(
+        board, min_depth=min_depth, max_time=max_time, time_limit=time_limit_s
+    )
     return {
             "best_move": analysis["pv"][0].uci(),
             "score": str(analysis["score"].relative),
@@ -44,16 +104,16 @@ def analyze_position(fen: str):
     }
 
 @mcp.tool()
-def get_best_move(fen: str):
+def get_best_move(fen: str, time_limit_s: float = None):
     """Get the best move for a chess position"""
-    board  = chess.Board(fen)
-    return stockfish_manager.get_best_move(board).uci()
+    board = _board_from_fen(fen).copy(stack=False)
+    return stockfish_manager.get_best_move(board, time_limit=time_limit_s).uci()
 
 @mcp.tool()
-def get_top_moves(fen: str, count: int = 5):
+def get_top_moves(fen: str, count: int = 5, time_limit_s: float = None):
     """Get the top N moves for a chess position"""
-    board = chess.Board(fen)
-    moves_data = stockfish_manager.get_top_moves(board, count)
+    board = _board_from_fen(fen).copy(stack=False)
+    moves_data = stockfish_manager.get_top_moves(board, count, time_limit=time_limit_s)
     return [
         {
             "move": move.uci(),
@@ -82,7 +142,7 @@ def record_opponent_move(move: str):
     if current_game is None:
         return {"error": "No active game. Start a game first."}
     try:
-        move_obj = chess.Move.from_uci(move)
+        move_obj = _move_from_uci(move)
         current_game.make_move(move_obj)
         return {"status": "Move recorded"}
     except ValueError as e:
@@ -95,7 +155,7 @@ def make_move(move: str):
     if current_game is None:
         return {"error": "No active game. Start a game first."}
     try:
-        move_obj = chess.Move.from_uci(move)
+        move_obj = _move_from_uci(move)
         current_game.make_move(move_obj)
         return {"status": "Move made"}
     except ValueError as e:
@@ -1,100 +1,243 @@
-import chess.engine
+from __future__ import annotations
+
 import chess
-from typing import Optional
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
 import logging
+import os
+import queue
 import threading
+import time
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+
+if TYPE_CHECKING:
+    import chess.engine
+
+# chess.engine pulls in asyncio and subprocess machinery; it is only imported
+# once an engine is actually needed, not when the server starts
+_chess_engine = None
+
+def _engine_module():
+    global _chess_engine
+    if _chess_engine is None:
+        import chess.engine as _chess_engine
+    return _chess_engine
+
+def _bb_key(board: chess.Board) -> tuple:
+    """Hashable position identity read straight from the board's bitboards"""
+    # Unlike board._transposition_key() this skips the legal en passant check,
+    # so a position with a stale en passant square may take a second cache entry
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK], board.turn,
+            board.castling_rights, board.ep_square)
 
 class StockfishManager:
-    limit: chess.engine.Limit
-    engine: Optional[chess.engine.SimpleEngine] = None
     stockfish_path: str
-    first_run = True
-    _lock: threading.Lock
+    threads: int
+    hash_mb: int
+    pool_size: int
+    _pool: queue.Queue
+    _spawned: int
+    _spawn_lock: threading.Lock
+    _analysis_cache: OrderedDict
+    _cache_lock: threading.Lock
+    _MAX_CACHE_ENTRIES = 4096
     
-    def __init__(self, stockfish_path: str = None, depth=15):
-        self.limit = chess.engine.Limit(depth=depth)
+    def __init__(self, stockfish_path: str = None, depth=15, threads: int = 2, hash_mb: int = 256,
+                 pool_size: int = None, time_limit: float = 0.5):
+        # The time cap bounds searches that would otherwise run long before reaching depth
+        self._depth = depth
+        self._time_limit = time_limit
+        self._limit = None
         self.stockfish_path = stockfish_path
-        self._lock = threading.Lock()
-    
-    def _ensure_engine(self):
-        """Ensure engine is running, start or restart if needed"""
-        if self.engine is None or self.first_run:
-            try:
-                if self.stockfish_path:
-                    self.engine = chess.engine.SimpleEngine.popen_uci(self.stockfish_path)
-                else:
-                    self.engine = chess.engine.SimpleEngine.popen_uci("stockfish")
-                # Verify engine is responsive with ping
-                self.engine.ping()
-                logger.debug("Engine launched and verified")
-                self.first_run = False
-            except Exception as e:
-                logger.error(f"Failed to start engine: {e}")
-                self.engine = None
-                raise
+        self.threads = threads
+        self.hash_mb = hash_mb
+        self.pool_size = pool_size or max(1, (os.cpu_count() or 1) // threads)
+        # Idle engines; processes are launched lazily up to pool_size
+        self._pool = queue.Queue()
+        self._spawned = 0
+        self._spawn_lock = threading.Lock()
+        # Engine results keyed by position, search depth and multipv
+        self._analysis_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
     
-    def _restart_engine_if_needed(self):
-        """Restart engine if it has terminated"""
+    @property
+    def limit(self) -> chess.engine.Limit:
+        """Default search limit, built on first use"""
+        if self._limit is None:
+            self._limit = _engine_module().Limit(depth=self._depth, time=self._time_limit)
+        return self._limit
+
+    def _launch_engine(self) -> chess.engine.SimpleEngine:
+        """Start a new Stockfish process configured for this pool"""
+        try:
+            engine = _engine_module().SimpleEngine.popen_uci(self.stockfish_path or "stockfish")
+            engine.configure({"Threads": self.threads, "Hash": self.hash_mb})
+            # Verify engine is responsive with ping
+            engine.ping()
+            logger.debug("Engine launched and verified")
+            return engine
+        except Exception as e:
+            logger.error(f"Failed to start engine: {e}")
+            raise
+
+    def _acquire_engine(self) -> chess.engine.SimpleEngine:
+        """Take an idle engine, launching a new one while the pool is below size"""
         try:
-            if self.engine is not None:
-                self.engine.ping()
-        except (chess.engine.EngineTerminatedError, chess.engine.EngineError) as e:
-            logger.warning(f"Engine terminated, restarting: {e}")
-            self.engine = None
-            self._ensure_engine()
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._spawn_lock:
+            if self._spawned < self.pool_size:
+                engine = self._launch_engine()
+                self._spawned += 1
+                return engine
+        return self._pool.get()
+
+    def _replace_engine(self, engine: chess.engine.SimpleEngine) -> chess.engine.SimpleEngine:
+        try:
+            engine.quit()
+        except Exception:
+            pass
+        return self._launch_engine()
     
-    def analyze_position(self, board: chess.Board):
-        with self._lock:
-            self._ensure_engine()
-            self._restart_engine_if_needed()
-            try:
-                return self.engine.analyse(board, self.limit)
-            except (chess.engine.EngineTerminatedError, chess.engine.EngineError) as e:
-                logger.error(f"Engine error during analysis: {e}")
-                self.engine = None
-                self._ensure_engine()
-                # Retry once after restart
-                return self.engine.analyse(board, self.limit)
+    def _run(self, operation, description: str):
+        """Run operation(engine) on a pooled engine, retrying once after a restart"""
+        engine = self._acquire_engine()
+        # No health-check ping up front: a dead engine fails the operation itself
+        try:
+            return operation(engine)
+        except (_engine_module().EngineTerminatedError, _engine_module().EngineError) as e:
+            logger.error(f"Engine error during {description}: {e}")
+            engine = self._replace_engine(engine)
+            # Retry once after restart
+            return operation(engine)
+        finally:
+            # A dead engine that could not be replaced is restarted by its next user
+            self._pool.put(engine)
+
+    def _limit_for(self, time_limit: Optional[float]) -> chess.engine.Limit:
+        """Search limit with the time cap overridden for a single call"""
+        if time_limit is None:
+            return self.limit
+        return _engine_module().Limit(depth=self._depth, time=time_limit)
+
+    def _cache_key(self, board: chess.Board, limit: chess.engine.Limit, multipv: Optional[int] = None):
+        return (_bb_key(board), limit.depth, limit.time, multipv)
+
+    def _cache_get(self, key):
+        """Return a cached engine result, or None on a miss"""
+        with self._cache_lock:
+            result = self._analysis_cache.get(key)
+            if result is None:
+                self._cache_misses += 1
+                return None
+            self._analysis_cache.move_to_end(key)
+            self._cache_hits += 1
+            return result
+
+    def _cache_put(self, key, result):
+        with self._cache_lock:
+            self._analysis_cache[key] = result
+            self._analysis_cache.move_to_end(key)
+            if len(self._analysis_cache) > self._MAX_CACHE_ENTRIES:
+                self._analysis_cache.popitem(last=False)
+
+    def analysis_cache_stats(self) -> dict:
+        """Hit/miss counters and current size of the analysis cache"""
+        with self._cache_lock:
+            return {
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "size": len(self._analysis_cache),
+                "max_size": self._MAX_CACHE_ENTRIES,
+            }
+
+    @staticmethod
+    def _compact_info(info) -> dict:
+        """Keep only the fields the tools report, to keep cache entries small"""
+        return {key: info[key] for key in ("pv", "score", "depth", "nodes", "time") if key in info}
+
+    def _analyse_within(self, engine: chess.engine.SimpleEngine, board: chess.Board, limit: chess.engine.Limit,
+                        min_depth: int, max_time: float):
+        """Stream a search and stop once max_time has passed with a PV of at least min_depth"""
+        start = time.monotonic()
+        with engine.analysis(board, limit) as analysis:
+            for info in analysis:
+                if "pv" in info and info.get("depth", 0) >= min_depth and time.monotonic() - start > max_time:
+                    return dict(analysis.info), False
+            return dict(analysis.info), True
+
+    def analyze_position(self, board: chess.Board, min_depth: int = None, max_time: float = None,
+                         time_limit: float = None):
+        """Search to the configured depth, or with max_time stop early once a PV of min_depth exists"""
+        if min_depth is not None and max_time is None:
+            raise ValueError("min_depth only applies together with max_time")
+        limit = self._limit_for(time_limit)
+        key = self._cache_key(board, limit)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return dict(cached)
+        if max_time is None:
+            info, complete = self._run(lambda engine: (engine.analyse(board, limit), True), "analysis")
+        else:
+            info, complete = self._run(
+                lambda engine: self._analyse_within(engine, board, limit, min_depth or 1, max_time), "analysis"
+            )
+        result = self._compact_info(info)
+        # Searches cut short by max_time are not full-depth results
+        if complete:
+            self._cache_put(key, result)
+        return dict(result)
     
-    def get_best_move(self, board:chess.Board):
-        with self._lock:
-            self._ensure_engine()
-            self._restart_engine_if_needed()
-            try:
-                result = self.engine.play(board, self.limit)
-                return result.move
-            except (chess.engine.EngineTerminatedError, chess.engine.EngineError) as e:
-                logger.error(f"Engine error during move search: {e}")
-                self.engine = None
-                self._ensure_engine()
-                # Retry once after restart
-                result = self.engine.play(board, self.limit)
-                return result.move
-
-    def get_top_moves(self, board: chess.Board, count=10):
-        with self._lock:
-            self._ensure_engine()
-            self._restart_engine_if_needed()
-            try:
-                results = self.engine.analyse(board, self.limit, multipv=count)
-                return [(result["pv"][0], result["score"]) for result in results]
-            except (chess.engine.EngineTerminatedError, chess.engine.EngineError) as e:
-                logger.error(f"Engine error during multi-pv analysis: {e}")
-                self.engine = None
-                self._ensure_engine()
-                # Retry once after restart
-                results = self.engine.analyse(board, self.limit, multipv=count)
-                return [(result["pv"][0], result["score"]) for result in results]
+    def analyze_sequence(self, boards: list[chess.Board]) -> list[dict]:
+        """Analyse related positions back to back on one engine so each search reuses its hash table"""
+        keys = [self._cache_key(board, self.limit) for board in boards]
+        results = [self._cache_get(key) for key in keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            # One checkout for the whole batch; no ucinewgame is sent between searches
+            infos = self._run(
+                lambda engine: [engine.analyse(boards[i], self.limit) for i in pending], "sequence analysis"
+            )
+            for i, info in zip(pending, infos):
+                results[i] = self._compact_info(info)
+                self._cache_put(keys[i], results[i])
+        return [dict(result) for result in results]
+
+    def get_best_move(self, board:chess.Board, time_limit: float = None):
+        """Best move is the head of the analysis PV, so both share one search"""
+        pv = self.analyze_position(board, time_limit=time_limit).get("pv")
+        return pv[0] if pv else None
+
+    def get_top_moves(self, board: chess.Board, count=10, time_limit: float = None):
+        limit = self._limit_for(time_limit)
+        key = self._cache_key(board, limit, count)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return list(cached)
+        results = self._run(
+            lambda engine: engine.analyse(board, limit, multipv=count), "multi-pv analysis"
+        )
+        top_moves = [(result["pv"][0], result["score"]) for result in results]
+        self._cache_put(key, tuple(top_moves))
+        return top_moves
     
     def close(self):
-        with self._lock:
-            if self.engine is not None:
-                try:
-                    self.engine.quit()
-                except Exception as e:
-                    logger.warning(f"Error closing engine: {e}")
-                finally:
-                    self.engine = None
\ No newline at end of file
+        """Quit every engine in the pool, waiting for checked-out engines to be returned"""
+        while True:
+            with self._spawn_lock:
+                if self._spawned == 0:
+                    break
+            # Blocks until an in-flight request puts its engine back
+            engine = self._pool.get()
+            try:
+                engine.quit()
+            except Exception as e:
+                logger.warning(f"Error closing engine: {e}")
+            finally:
+                with self._spawn_lock:
+                    self._spawned -= 1
@@ -0,0 +1,24 @@
+"""FEN strings shared by fixtures, mocks and tests, interned once"""
+
+import sys
+
+STARTING = sys.intern("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+AFTER_E4 = sys.intern("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+SICILIAN = sys.intern("rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2")
+ENDGAME = sys.intern("8/8/8/8/8/8/4K3/4k3 w - - 0 1")
+
+SAMPLE_POSITIONS = {
+    "starting": STARTING,
+    "after_e4": AFTER_E4,
+    "sicilian": SICILIAN,
+    "endgame": ENDGAME,
+}
+
+INVALID_FENS = (
+    "invalid_fen_string",
+    "",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP",  # Missing game state entirely
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 extra",  # Extra data
+    "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",  # Invalid rank (9 squares)
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR X KQkq - 0 1",  # Invalid turn
+)
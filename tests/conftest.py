@@ -1,42 +1,80 @@
+import asyncio
 import pytest
+import pytest_asyncio
 import chess
-from unittest.mock import Mock
+from mcp.shared.memory import create_connected_server_and_client_session
+from server import mcp
 from mocks.mock_stockfish import MockStockfishManager
+from _fens import INVALID_FENS, SAMPLE_POSITIONS, STARTING
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def event_loop_policy():
     """Configure asyncio for testing"""
-    import asyncio
     return asyncio.get_event_loop_policy()
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def starting_position():
     """Standard chess starting position FEN"""
-    return "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+    return STARTING
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_game_positions():
     """Common chess positions for testing"""
-    return {
-        "starting": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
-        "after_e4": "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1",
-        "sicilian": "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2",
-        "endgame": "8/8/8/8/8/8/4K3/4k3 w - - 0 1"
-    }
+    return SAMPLE_POSITIONS
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def invalid_fens():
     """Invalid FEN strings for negative testing"""
-    return [
-        "invalid_fen_string",
-        "",
-        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP",  # Missing game state entirely
-        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 extra",  # Extra data
-        "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",  # Invalid rank (9 squares)
-        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR X KQkq - 0 1",  # Invalid turn
-    ]
+    return INVALID_FENS
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def starting_board(starting_position):
+    """Starting position parsed once; copy before pushing moves"""
+    return chess.Board(starting_position)
+
+@pytest.fixture(scope="session")
+def sample_game_boards(sample_game_positions):
+    """sample_game_positions parsed once; copy before pushing moves"""
+    return {name: chess.Board(fen) for name, fen in sample_game_positions.items()}
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def client():
+    """In-memory MCP client session shared by a test module"""
+    # anyio task groups must exit in the task that entered them, and
+    # pytest-asyncio tears module fixtures down in a different task.
+    ready = asyncio.get_running_loop().create_future()
+    done = asyncio.Event()
+
+    async def hold_session():
+        async with create_connected_server_and_client_session(mcp) as session:
+            ready.set_result(session)
+            await done.wait()
+
+    holder = asyncio.create_task(hold_session())
+    holder.add_done_callback(lambda task: ready.done() or ready.set_exception(
+        task.exception() or RuntimeError("MCP client session closed during setup")))
+    yield await ready
+    done.set()
+    await holder
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def mcp_tools(client):
+    """Tool listing fetched once per module"""
+    return (await client.list_tools()).tools
+
+@pytest.fixture(scope="session")
 def mock_manager():
     """Fixture providing a mock StockfishManager for all tests"""
-    return MockStockfishManager()
\ No newline at end of file
+    return MockStockfishManager()
+
+@pytest.fixture
+def patch_stockfish_manager(monkeypatch, mock_manager):
+    """Route server tools to the mock manager for the duration of a test"""
+    monkeypatch.setattr("server.stockfish_manager", mock_manager)
+    return mock_manager
+
+@pytest.fixture(autouse=True)
+def _reset_mock_manager(mock_manager):
+    """Clear recorded engine calls so each test sees only its own"""
+    mock_manager.reset_calls()
+    yield
\ No newline at end of file
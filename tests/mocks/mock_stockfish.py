@@ -2,24 +2,25 @@
 
 import chess
 import chess.engine
+import chess.polyglot
+from collections import deque
 from typing import List, Tuple
-from unittest.mock import Mock
+
+from _fens import AFTER_E4, SICILIAN, STARTING
 
 
 class MockStockfishManager:
     """Mock StockfishManager that returns predictable results for testing"""
     
-    def __init__(self, stockfish_path: str = None, depth: int = 15):
-        self.limit = chess.engine.Limit(depth=depth)
+    def __init__(self, stockfish_path: str = None, depth: int = 15, time_limit: float = 0.5):
+        self.limit = chess.engine.Limit(depth=depth, time=time_limit)
         self.stockfish_path = stockfish_path
-        self.engine = Mock()
-        self.first_run = False  # Mock is always "initialized"
-        self.engine_calls = []  # Track calls for test verification
+        self.engine_calls = deque(maxlen=10000)  # Track recent calls for test verification
         
         # Predefined responses for common positions
         self._responses = {
             # Starting position
-            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1": {
+            STARTING: {
                 "best_move": "e2e4",
                 "score": 20,  # +0.20 for white
                 "top_moves": [
@@ -31,7 +32,7 @@ class MockStockfishManager:
                 ]
             },
             # After 1.e4
-            "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1": {
+            AFTER_E4: {
                 "best_move": "e7e5",
                 "score": -15,  # Slight advantage to white
                 "top_moves": [
@@ -43,7 +44,7 @@ class MockStockfishManager:
                 ]
             },
             # Sicilian Defense
-            "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2": {
+            SICILIAN: {
                 "best_move": "g1f3",
                 "score": 25,
                 "top_moves": [
@@ -55,60 +56,66 @@ class MockStockfishManager:
                 ]
             }
         }
+        # Default response for unknown positions
+        self._default_response = self._build_response({
+            "best_move": "e2e4",  # Default move
+            "score": 0,  # Equal position
+            "top_moves": [("e2e4", 0), ("d2d4", -5), ("g1f3", -10)]
+        })
+        for response in self._responses.values():
+            self._build_response(response)
+        # Zobrist keys ignore move clocks and en passant squares that cannot be
+        # captured, so lookups match however the FEN was written
+        self._responses_by_zobrist = {
+            chess.polyglot.zobrist_hash(chess.Board(fen)): response
+            for fen, response in self._responses.items()
+        }
     
-    def _get_response(self, fen: str):
-        """Get predefined response for a position, or default values"""
-        if fen in self._responses:
-            return self._responses[fen]
-        else:
-            # Default response for unknown positions
-            return {
-                "best_move": "e2e4",  # Default move
-                "score": 0,  # Equal position
-                "top_moves": [("e2e4", 0), ("d2d4", -5), ("g1f3", -10)]
-            }
+    @staticmethod
+    def _build_response(response: dict) -> dict:
+        """Parse a response's moves and scores once, up front"""
+        response["best_move_obj"] = chess.Move.from_uci(response["best_move"])
+        response["score_obj"] = chess.engine.PovScore(chess.engine.Cp(response["score"]), chess.WHITE)
+        response["top_moves_obj"] = [
+            (chess.Move.from_uci(move), chess.engine.PovScore(chess.engine.Cp(score), chess.WHITE))
+            for move, score in response["top_moves"]
+        ]
+        return response
     
-    def _ensure_engine(self):
-        """Mock implementation - always succeeds"""
-        pass
+    def _get_response(self, key: int):
+        """Get predefined response for a position's Zobrist key, or default values"""
+        return self._responses_by_zobrist.get(key, self._default_response)
     
-    def analyze_position(self, board: chess.Board):
+    def analyze_position(self, board: chess.Board, min_depth: int = None, max_time: float = None,
+                         time_limit: float = None):
         """Mock analyze_position that returns predictable results"""
-        fen = board.fen()
-        self.engine_calls.append(("analyze", fen))
+        key = chess.polyglot.zobrist_hash(board)
+        self.engine_calls.append(("analyze", key))
         
-        response = self._get_response(fen)
-        best_move = chess.Move.from_uci(response["best_move"])
-        score = chess.engine.PovScore(chess.engine.Cp(response["score"]), chess.WHITE)
+        response = self._get_response(key)
         
         return {
-            "pv": [best_move],
-            "score": score,
+            "pv": [response["best_move_obj"]],
+            "score": response["score_obj"],
             "depth": self.limit.depth,
             "nodes": 100000,  # Mock node count
             "time": 0.5  # Mock analysis time
         }
     
-    def get_best_move(self, board: chess.Board) -> chess.Move:
+    def get_best_move(self, board: chess.Board, time_limit: float = None) -> chess.Move:
         """Mock get_best_move that returns predictable moves"""
-        fen = board.fen()
-        self.engine_calls.append(("best_move", fen))
+        key = chess.polyglot.zobrist_hash(board)
+        self.engine_calls.append(("best_move", key))
         
-        response = self._get_response(fen)
-        return chess.Move.from_uci(response["best_move"])
+        return self._get_response(key)["best_move_obj"]
     
-    def get_top_moves(self, board: chess.Board, count: int = 10) -> List[Tuple[chess.Move, chess.engine.PovScore]]:
+    def get_top_moves(self, board: chess.Board, count: int = 10,
+                      time_limit: float = None) -> List[Tuple[chess.Move, chess.engine.PovScore]]:
         """Mock get_top_moves that returns predictable move lists"""
-        fen = board.fen()
-        self.engine_calls.append(("top_moves", fen, count))
+        key = chess.polyglot.zobrist_hash(board)
+        self.engine_calls.append(("top_moves", key, count))
         
-        response = self._get_response(fen)
-        top_moves = response["top_moves"][:count]  # Limit to requested count
-        
-        return [
-            (chess.Move.from_uci(move), chess.engine.PovScore(chess.engine.Cp(score), chess.WHITE))
-            for move, score in top_moves
-        ]
+        return self._get_response(key)["top_moves_obj"][:count]  # Limit to requested count
     
     def close(self):
         """Mock close method"""
@@ -116,12 +123,14 @@ class MockStockfishManager:
     
     def reset_calls(self):
         """Reset call tracking for test isolation"""
-        self.engine_calls = []
+        self.engine_calls.clear()
 
 
 class MockGameState:
     """Mock GameState for testing game functionality"""
-    
+
+    __slots__ = ("board", "ai_color", "current_player", "difficulty", "move_history")
+
     def __init__(self, ai_color: chess.Color, difficulty: int = 10, fen: str = None):
         if fen:
             try:
@@ -138,7 +147,7 @@ class MockGameState:
     
     def make_move(self, move: chess.Move):
         """Make a move and update game state"""
-        if move in self.board.legal_moves:
+        if self.board.is_legal(move):
             self.board.push(move)
             self.move_history.append(move)
             self.current_player = not self.current_player
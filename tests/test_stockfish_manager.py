@@ -0,0 +1,337 @@
+"""Test StockfishManager behaviour against a fake UCI engine"""
+
+import threading
+
+import chess
+import chess.engine
+import pytest
+
+from stockfish_manager import StockfishManager
+
+
+class FakeEngine:
+    """Stands in for chess.engine.SimpleEngine and counts searches"""
+
+    def __init__(self):
+        self.searches = 0
+        self.options = {}
+        self.closed = False
+        self.limits = []
+        self.pings = 0
+
+    def configure(self, options):
+        self.options.update(options)
+
+    def ping(self):
+        self.pings += 1
+
+    def analyse(self, board, limit, multipv=None):
+        self.searches += 1
+        self.limits.append(limit)
+        moves = list(board.legal_moves)
+        infos = [
+            {
+                "pv": [move],
+                "score": chess.engine.PovScore(chess.engine.Cp(20 - i), board.turn),
+                "depth": limit.depth,
+                "seldepth": limit.depth + 4,
+            }
+            for i, move in enumerate(moves[:multipv or 1])
+        ]
+        return infos if multipv is not None else infos[0]
+
+    def analysis(self, board, limit):
+        self.searches += 1
+        move = next(iter(board.legal_moves))
+        return FakeAnalysis([
+            {"depth": depth, "pv": [move], "score": chess.engine.PovScore(chess.engine.Cp(depth), board.turn)}
+            for depth in range(1, limit.depth + 1)
+        ])
+
+    def quit(self):
+        self.closed = True
+
+
+class FakeAnalysis:
+    """Iterates over a fixed series of info lines like SimpleAnalysisResult"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.info = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __iter__(self):
+        for line in self.lines:
+            self.info.update(line)
+            yield line
+
+
+class CrashingEngine(FakeEngine):
+    """Engine whose process dies during the first search"""
+
+    def analyse(self, board, limit, multipv=None):
+        raise chess.engine.EngineTerminatedError("engine process died")
+
+
+@pytest.fixture
+def fake_engine():
+    """Single FakeEngine shared by every launch in a test"""
+    return FakeEngine()
+
+
+@pytest.fixture
+def launched_engines(monkeypatch):
+    """Launch a fresh FakeEngine per process and record each one"""
+    launched = []
+
+    def popen_uci(path):
+        launched.append(FakeEngine())
+        return launched[-1]
+
+    monkeypatch.setattr(chess.engine.SimpleEngine, "popen_uci", popen_uci)
+    return launched
+
+
+@pytest.fixture
+def manager(monkeypatch, fake_engine):
+    """One-engine StockfishManager backed by fake_engine"""
+    monkeypatch.setattr(chess.engine.SimpleEngine, "popen_uci", lambda path: fake_engine)
+    return StockfishManager(depth=12, pool_size=1)
+
+
+class TestAnalysisCache:
+    """Repeated queries for the same position should not search again"""
+
+    def test_analyze_position_cached(self, manager, fake_engine, starting_board):
+        """Test a repeated analyze_position call is answered from the cache"""
+        first = manager.analyze_position(starting_board)
+        second = manager.analyze_position(starting_board)
+
+        assert fake_engine.searches == 1, "Second analysis should be served from cache"
+        assert first == second, "Cached analysis should match the original result"
+        assert "seldepth" not in second, "Cache entries should only keep reported fields"
+
+    def test_cache_distinguishes_positions(self, manager, fake_engine, sample_game_boards):
+        """Test different positions get separate cache entries"""
+        for board in sample_game_boards.values():
+            manager.analyze_position(board)
+
+        assert fake_engine.searches == len(sample_game_boards), "Each position should be searched once"
+
+    def test_cache_ignores_move_clocks(self, manager, fake_engine):
+        """Test positions differing only in move clocks share a cache entry"""
+        manager.analyze_position(chess.Board("8/8/8/8/8/8/4K3/4k3 w - - 0 1"))
+        manager.analyze_position(chess.Board("8/8/8/8/8/8/4K3/4k3 w - - 12 40"))
+
+        assert fake_engine.searches == 1, "Move clocks do not change the position"
+
+    def test_top_moves_cached_per_count(self, manager, fake_engine, starting_board):
+        """Test get_top_moves caches results separately for each move count"""
+        manager.get_top_moves(starting_board, 3)
+        manager.get_top_moves(starting_board, 3)
+        assert fake_engine.searches == 1, "Same count should be served from cache"
+
+        assert len(manager.get_top_moves(starting_board, 5)) == 5, "Should return the requested number of moves"
+        assert fake_engine.searches == 2, "A different multipv count needs a new search"
+
+    def test_best_move_shares_analysis(self, manager, fake_engine, starting_board):
+        """Test get_best_move reuses a cached analyze_position result"""
+        analysis = manager.analyze_position(starting_board)
+        best_move = manager.get_best_move(starting_board)
+
+        assert best_move == analysis["pv"][0], "Best move should be the first move of the principal variation"
+        assert fake_engine.searches == 1, "get_best_move should reuse the cached analysis"
+
+    def test_cache_evicts_oldest_entry(self, manager, monkeypatch, starting_board):
+        """Test the cache stays within its size limit by evicting old entries"""
+        monkeypatch.setattr(StockfishManager, "_MAX_CACHE_ENTRIES", 2)
+        for count in (1, 2, 3):
+            manager.get_top_moves(starting_board, count)
+
+        stats = manager.analysis_cache_stats()
+        assert stats["size"] == 2, "Cache should not grow past its maximum size"
+        assert stats["misses"] == 3, "Each distinct count should miss the cache"
+
+    def test_cache_stats(self, manager, starting_board):
+        """Test analysis_cache_stats reports hits, misses and size"""
+        manager.analyze_position(starting_board)
+        manager.analyze_position(starting_board)
+
+        stats = manager.analysis_cache_stats()
+        assert stats["hits"] == 1, "Second analysis should count as a hit"
+        assert stats["misses"] == 1, "First analysis should count as a miss"
+        assert stats["size"] == 1, "One position should be cached"
+
+
+class TestSearchLimit:
+    """Searches are capped by time as well as depth"""
+
+    def test_default_limit_has_time_cap(self):
+        """Test the default search limit combines depth and time"""
+        manager = StockfishManager(depth=12, time_limit=0.25)
+
+        assert manager.limit == chess.engine.Limit(depth=12, time=0.25), "Limit should cap both depth and time"
+
+    def test_time_limit_override_per_call(self, manager, fake_engine, starting_board):
+        """Test time_limit overrides the time cap for a single call"""
+        manager.analyze_position(starting_board)
+        manager.get_top_moves(starting_board, 3, time_limit=2.0)
+
+        assert fake_engine.limits == [manager.limit, chess.engine.Limit(depth=12, time=2.0)], "Only the call with time_limit should use the overridden cap"
+
+    def test_time_limit_is_part_of_cache_key(self, manager, fake_engine, starting_board):
+        """Test results for different time limits are cached separately"""
+        manager.analyze_position(starting_board)
+        manager.analyze_position(starting_board, time_limit=2.0)
+        manager.get_best_move(starting_board, time_limit=2.0)
+
+        assert fake_engine.searches == 2, "Each time limit should need its own search"
+
+
+class TestTimeBudget:
+    """analyze_position can stop streaming once the time budget is spent"""
+
+    def test_stops_at_min_depth_when_budget_spent(self, manager, starting_board):
+        """Test analysis stops at min_depth once max_time has passed"""
+        analysis = manager.analyze_position(starting_board, min_depth=5, max_time=0)
+
+        assert analysis["depth"] == 5, "Search should stop as soon as min_depth is reached"
+        assert analysis["pv"], "Truncated analysis should still have a principal variation"
+
+    def test_runs_to_full_depth_within_budget(self, manager, starting_board):
+        """Test analysis reaches full depth when the budget allows"""
+        analysis = manager.analyze_position(starting_board, max_time=60)
+
+        assert analysis["depth"] == manager.limit.depth, "Search should reach the configured depth"
+
+    def test_min_depth_requires_max_time(self, manager, fake_engine, starting_board):
+        """Test min_depth without max_time is rejected instead of silently ignored"""
+        with pytest.raises(ValueError, match="max_time"):
+            manager.analyze_position(starting_board, min_depth=20)
+
+        assert fake_engine.searches == 0, "A rejected request should not start a search"
+
+    def test_partial_results_not_cached(self, manager, fake_engine, starting_board):
+        """Test a search cut short by max_time is not cached"""
+        manager.analyze_position(starting_board, min_depth=5, max_time=0)
+        full = manager.analyze_position(starting_board)
+
+        assert fake_engine.searches == 2, "A truncated search should not satisfy a full analysis"
+        assert full["depth"] == manager.limit.depth, "Full analysis should reach the configured depth"
+
+
+class TestAnalyzeSequence:
+    """A sequence of positions is searched on a single engine"""
+
+    def test_sequence_matches_individual_analysis(self, manager, sample_game_boards):
+        """Test analyze_sequence returns the same results as analyze_position"""
+        boards = list(sample_game_boards.values())
+
+        results = manager.analyze_sequence(boards)
+
+        assert len(results) == len(boards), "Should return one result per position"
+        for board, result in zip(boards, results):
+            assert result == manager.analyze_position(board), f"Sequence result should match analysis of {board.fen()}"
+
+    def test_sequence_only_searches_uncached_positions(self, manager, fake_engine, sample_game_boards):
+        """Test analyze_sequence skips positions that are already cached"""
+        boards = list(sample_game_boards.values())
+        manager.analyze_position(boards[1])
+
+        manager.analyze_sequence(boards)
+
+        assert fake_engine.searches == len(boards), "Cached position should not be searched again"
+
+    def test_sequence_uses_one_engine(self, launched_engines, sample_game_boards):
+        """Test analyze_sequence checks out a single engine for the whole list"""
+        manager = StockfishManager(pool_size=4)
+
+        manager.analyze_sequence(list(sample_game_boards.values()))
+
+        assert len(launched_engines) == 1, "Only one engine should be launched"
+
+
+class TestEnginePool:
+    """Engine processes are launched lazily into a bounded pool"""
+
+    def test_engine_configured_with_threads_and_hash(self, monkeypatch, fake_engine):
+        """Test launched engines are configured with Threads and Hash"""
+        monkeypatch.setattr(chess.engine.SimpleEngine, "popen_uci", lambda path: fake_engine)
+        manager = StockfishManager(threads=3, hash_mb=128)
+
+        manager._run(lambda engine: None, "test")
+
+        assert fake_engine.options == {"Threads": 3, "Hash": 128}, "Engine should get the manager's Threads and Hash"
+
+    def test_pool_size_defaults_to_cores_per_thread_count(self, monkeypatch):
+        """Test the default pool size divides the cores between engine threads"""
+        monkeypatch.setattr("os.cpu_count", lambda: 8)
+        assert StockfishManager(threads=2).pool_size == 4, "8 cores at 2 threads each should give 4 engines"
+        assert StockfishManager(threads=16).pool_size == 1, "Pool should always hold at least one engine"
+
+    def test_pool_launches_up_to_pool_size(self, launched_engines):
+        """Test the pool launches engines on demand up to pool_size"""
+        manager = StockfishManager(pool_size=2)
+
+        first = manager._acquire_engine()
+        second = manager._acquire_engine()
+        manager._pool.put(first)
+        third = manager._acquire_engine()
+
+        assert first is not second, "A busy engine should not be handed out again"
+        assert third is first, "An idle engine should be reused before launching another"
+        assert len(launched_engines) == 2, "Only pool_size engines should be launched"
+
+    def test_engine_pinged_only_at_launch(self, manager, fake_engine, sample_game_boards):
+        """Test engines are health-checked at launch rather than per request"""
+        for board in sample_game_boards.values():
+            manager.analyze_position(board)
+
+        assert fake_engine.pings == 1, "Requests should not pay a UCI round-trip for a health check"
+
+    def test_close_quits_idle_engines(self, manager, fake_engine, starting_board):
+        """Test close() quits engines waiting in the pool"""
+        manager.analyze_position(starting_board)
+        manager.close()
+
+        assert fake_engine.closed, "Idle engine should be quit"
+        assert manager._pool.empty(), "No engine should be left in the pool"
+
+    def test_close_waits_for_checked_out_engines(self, manager, fake_engine):
+        """Test close() quits engines that are busy with a search when it is called"""
+        started, release = threading.Event(), threading.Event()
+        search = threading.Thread(
+            target=manager._run, args=(lambda engine: (started.set(), release.wait()), "search")
+        )
+        search.start()
+        started.wait()
+        closer = threading.Thread(target=manager.close)
+        closer.start()
+
+        closer.join(timeout=0.1)
+        assert closer.is_alive(), "close() should wait for the in-flight search"
+        release.set()
+        search.join()
+        closer.join()
+
+        assert fake_engine.closed, "The engine returned after close() started should be quit"
+        assert manager._pool.empty(), "No engine should be left in the pool"
+        assert manager._spawned == 0, "Every launched engine should be accounted for"
+
+    def test_crashed_engine_replaced_and_retried(self, monkeypatch, starting_board):
+        """Test a crashed engine is replaced and the request retried once"""
+        crashed, healthy = CrashingEngine(), FakeEngine()
+        launches = iter([crashed, healthy])
+        monkeypatch.setattr(chess.engine.SimpleEngine, "popen_uci", lambda path: next(launches))
+        manager = StockfishManager(pool_size=1)
+
+        analysis = manager.analyze_position(starting_board)
+
+        assert analysis["pv"], "Analysis should succeed on the replacement engine"
+        assert crashed.closed, "Crashed engine should be quit"
+        assert manager._acquire_engine() is healthy, "Replacement engine should be returned to the pool"
@@ -1,22 +1,37 @@
-"""Test MCP tools using FastMCP client for proper MCP protocol testing"""
+"""Test MCP tools using an in-memory MCP client session"""
+
+import json
 
-import pytest
-from unittest.mock import patch
 import chess
+import pytest
 
 # Import server components for testing  
-from server import mcp
+import server
+from _fens import INVALID_FENS, SAMPLE_POSITIONS
+
+EXPECTED_CALL_SEQUENCE = ["analyze", "best_move", "top_moves"]
+
+FEN_CASES = (
+    [(fen, True) for fen in SAMPLE_POSITIONS.values()]
+    + [(fen, False) for fen in INVALID_FENS]
+    + [
+        ("invalid_fen", False),
+        ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w KQkq - 0 1", False),
+        ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN1R w KQkq - 0 1", False),
+    ]
+)
+
+
+def _truthy(result):
+    """Read a boolean tool result from its TextContent"""
+    return bool(result.content) and result.content[0].text.lower() == "true"
 
 
 class TestToolDiscovery:
     """Test MCP tool discovery and metadata"""
     
-    @pytest.mark.asyncio
-    async def test_list_tools(self):
+    def test_list_tools(self, mcp_tools):
         """Test that all expected tools are registered with MCP server"""
-        tools = await mcp.list_tools()
-        tool_names = [tool.name for tool in tools]
-        
         expected_tools = [
             "fen_validator",
             "analyze_position", 
@@ -28,15 +43,12 @@ class TestToolDiscovery:
             "get_game_status"
         ]
         
-        for tool_name in expected_tools:
-            assert tool_name in tool_names, f"Tool {tool_name} not found in MCP server tools"
+        missing = set(expected_tools) - {tool.name for tool in mcp_tools}
+        assert not missing, f"Missing tools: {missing}"
     
-    @pytest.mark.asyncio
-    async def test_tool_metadata(self):
+    def test_tool_metadata(self, mcp_tools):
         """Test that tools have proper metadata"""
-        tools = await mcp.list_tools()
-        
-        for tool in tools:
+        for tool in mcp_tools:
             assert tool.name, "Tool should have a name"
             assert hasattr(tool, 'inputSchema'), "Tool should have input schema"
 
@@ -44,129 +56,97 @@ class TestToolDiscovery:
 class TestFENValidator:
     """Test FEN validation tool"""
     
-    @pytest.mark.asyncio
-    async def test_valid_fen_positions(self, starting_position, sample_game_positions):
-        """Test FEN validator with valid positions using MCP call_tool"""
-        # Test starting position
-        result = await mcp.call_tool("fen_validator", {"fen": starting_position})
-        result_value = result[0][0].text.lower() == "true" if result and len(result[0]) > 0 else False
-        assert result_value == True, "Starting position should be valid"
-        
-        # Test various game positions
-        for position_name, fen in sample_game_positions.items():
-            result = await mcp.call_tool("fen_validator", {"fen": fen})
-            result_value = result[0][0].text.lower() == "true" if result and len(result[0]) > 0 else False
-            assert result_value == True, f"Position {position_name} should be valid: {fen}"
-    
-    @pytest.mark.asyncio
-    async def test_invalid_fen_positions(self, invalid_fens):
-        """Test FEN validator with invalid positions using MCP call_tool"""
-        for invalid_fen in invalid_fens:
-            result = await mcp.call_tool("fen_validator", {"fen": invalid_fen})
-            # Extract boolean result from TextContent
-            result_value = result[0][0].text.lower() == "true" if result and len(result[0]) > 0 else False
-            assert result_value == False, f"Invalid FEN should return False: {invalid_fen}"
-    
-    @pytest.mark.parametrize("fen,expected", [
-        ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", True),
-        ("invalid_fen", False),
-        ("rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2", True),
-        ("", False),
-        ("8/8/8/8/8/8/4K3/4k3 w - - 0 1", True),
-    ])
-    @pytest.mark.asyncio
-    async def test_fen_validation_cases(self, fen, expected):
-        """Parameterized test for various FEN validation cases using MCP call_tool"""
-        result = await mcp.call_tool("fen_validator", {"fen": fen})
-        result_value = result[0][0].text.lower() == "true" if result and len(result[0]) > 0 else False
-        assert result_value == expected, f"FEN {fen} validation result should be {expected}"
+    @pytest.mark.parametrize("fen,expected", FEN_CASES)
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_fen(self, client, fen, expected):
+        """Test FEN validator on valid and invalid positions using the MCP client"""
+        result = await client.call_tool("fen_validator", {"fen": fen})
+        assert _truthy(result) == expected, f"FEN {fen} validation result should be {expected}"
 
 
+@pytest.mark.usefixtures("patch_stockfish_manager")
 class TestAnalysisTools:
     """Test chess analysis tools with mocked StockfishManager"""
     
-    @pytest.mark.asyncio 
-    async def test_analyze_position_structure(self, starting_position, mock_manager):
-        """Test analyze_position returns expected data structure using MCP call_tool"""
-        with patch('server.stockfish_manager', mock_manager):
-            result = await mcp.call_tool("analyze_position", {"fen": starting_position})
-            
-            # Parse JSON response from TextContent
-            import json
-            result_data = json.loads(result[0].text)
-            
-            # Verify required fields are present
-            assert "best_move" in result_data, "analyze_position should return best_move"
-            assert "score" in result_data, "analyze_position should return score"
-            assert "depth" in result_data, "analyze_position should return depth"
-            assert "pv" in result_data, "analyze_position should return principal variation"
-            
-            # Verify data types
-            assert isinstance(result_data["best_move"], str), "best_move should be string"
-            assert isinstance(result_data["pv"], list), "pv should be list of moves"
-            assert len(result_data["pv"]) > 0, "pv should contain at least one move"
+    def test_analyze_position_structure(self, starting_position, mock_manager):
+        """Test analyze_position returns expected data structure"""
+        result_data = server.analyze_position(starting_position)
+        
+        # Verify required fields are present
+        assert "best_move" in result_data, "analyze_position should return best_move"
+        assert "score" in result_data, "analyze_position should return score"
+        assert "depth" in result_data, "analyze_position should return depth"
+        assert "pv" in result_data, "analyze_position should return principal variation"
+        
+        # Verify data types
+        assert isinstance(result_data["best_move"], str), "best_move should be string"
+        assert isinstance(result_data["pv"], list), "pv should be list of moves"
+        assert len(result_data["pv"]) > 0, "pv should contain at least one move"
     
-    @pytest.mark.asyncio
-    async def test_get_best_move(self, starting_position, mock_manager):
-        """Test get_best_move returns valid UCI move using MCP call_tool"""
-        with patch('server.stockfish_manager', mock_manager):
-            result = await mcp.call_tool("get_best_move", {"fen": starting_position})
-            
-            # Extract move string from TextContent
-            move_str = result[0].text
-            
-            # Should return a string in UCI format
-            assert isinstance(move_str, str), "get_best_move should return string"
-            assert len(move_str) >= 4, "UCI move should be at least 4 characters"
-            
-            # Should be a valid chess move
-            try:
-                move = chess.Move.from_uci(move_str)
-                board = chess.Board(starting_position)
-                assert move in board.legal_moves, f"Move {move_str} should be legal in starting position"
-            except ValueError:
-                pytest.fail(f"get_best_move returned invalid UCI move: {move_str}")
+    @pytest.mark.integration
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_analyze_position_round_trip(self, client, starting_position, mock_manager):
+        """Test analyze_position survives the MCP protocol round trip unchanged"""
+        result = await client.call_tool("analyze_position", {"fen": starting_position})
+        
+        # Parse JSON response from TextContent
+        result_data = json.loads(result.content[0].text)
+        
+        assert result_data == server.analyze_position(starting_position), "MCP result should match the tool's return value"
+    
+    @pytest.mark.asyncio(loop_scope="module")
+    async def test_get_best_move(self, client, starting_position, starting_board, mock_manager):
+        """Test get_best_move returns valid UCI move using the MCP client"""
+        result = await client.call_tool("get_best_move", {"fen": starting_position})
+        
+        # Extract move string from TextContent
+        move_str = result.content[0].text
+        
+        # Should return a string in UCI format
+        assert isinstance(move_str, str), "get_best_move should return string"
+        assert len(move_str) >= 4, "UCI move should be at least 4 characters"
+        
+        # Should be a valid chess move
+        try:
+            move = chess.Move.from_uci(move_str)
+            assert move in starting_board.legal_moves, f"Move {move_str} should be legal in starting position"
+        except ValueError:
+            pytest.fail(f"get_best_move returned invalid UCI move: {move_str}")
     
-    @pytest.mark.asyncio
-    async def test_get_top_moves_structure(self, starting_position, mock_manager):
+    def test_get_best_move_per_position(self, sample_game_positions, mock_manager):
+        """Test get_best_move answers for the position it was given"""
+        assert server.get_best_move(sample_game_positions["after_e4"]) == "e7e5"
+        assert server.get_best_move(sample_game_positions["sicilian"]) == "g1f3"
+    
+    def test_get_top_moves_structure(self, starting_position, mock_manager):
         """Test get_top_moves returns expected structure"""
-        with patch('server.stockfish_manager', mock_manager):
-            from server import get_top_moves
-            
-            # Test default count
-            result = get_top_moves(starting_position)
-            
-            assert isinstance(result, list), "get_top_moves should return list"
-            assert len(result) > 0, "get_top_moves should return at least one move"
-            assert len(result) <= 5, "get_top_moves should respect default count of 5"
-            
-            # Check structure of each move entry
-            for move_entry in result:
-                assert isinstance(move_entry, dict), "Each move should be a dict"
-                assert "move" in move_entry, "Each move entry should have 'move' field"
-                assert "score" in move_entry, "Each move entry should have 'score' field"
-                assert isinstance(move_entry["move"], str), "Move should be string"
+        # Test default count
+        result = server.get_top_moves(starting_position)
+        
+        assert isinstance(result, list), "get_top_moves should return list"
+        assert len(result) > 0, "get_top_moves should return at least one move"
+        assert len(result) <= 5, "get_top_moves should respect default count of 5"
+        
+        # Check structure of each move entry
+        for move_entry in result:
+            assert isinstance(move_entry, dict), "Each move should be a dict"
+            assert "move" in move_entry, "Each move entry should have 'move' field"
+            assert "score" in move_entry, "Each move entry should have 'score' field"
+            assert isinstance(move_entry["move"], str), "Move should be string"
     
-    @pytest.mark.asyncio
-    async def test_get_top_moves_count_parameter(self, starting_position, mock_manager):
+    def test_get_top_moves_count_parameter(self, starting_position, mock_manager):
         """Test get_top_moves respects count parameter"""
-        with patch('server.stockfish_manager', mock_manager):
-            from server import get_top_moves
-            
-            # Test different counts
-            for count in [1, 3, 10]:
-                result = get_top_moves(starting_position, count)
-                assert len(result) <= count, f"get_top_moves should return at most {count} moves"
+        # Test different counts
+        for count in [1, 3, 10]:
+            result = server.get_top_moves(starting_position, count)
+            assert len(result) <= count, f"get_top_moves should return at most {count} moves"
 
 
 class TestGameTools:
     """Test chess game management tools"""
     
-    @pytest.mark.asyncio
-    async def test_start_game_default_parameters(self):
+    def test_start_game_default_parameters(self):
         """Test start_game with default parameters"""
-        import server
-        
         result = server.start_game()
         
         assert isinstance(result, dict), "start_game should return dict"
@@ -177,11 +157,8 @@ class TestGameTools:
         assert server.current_game is not None, "current_game should be initialized"
         assert server.current_game.ai_color == chess.BLACK, "AI should be playing black"
     
-    @pytest.mark.asyncio
-    async def test_start_game_with_parameters(self):
+    def test_start_game_with_parameters(self):
         """Test start_game with custom parameters"""
-        import server
-        
         result = server.start_game(ai_color="white", difficulty=15)
         
         assert result["status"] == "Game started"
@@ -189,35 +166,24 @@ class TestGameTools:
         assert server.current_game.ai_color == chess.WHITE, "AI should be playing white"
         assert server.current_game.difficulty == 15, "Difficulty should be set to 15"
     
-    @pytest.mark.asyncio
-    async def test_start_game_with_custom_fen(self, sample_game_positions):
+    def test_start_game_with_custom_fen(self, sample_game_positions, sample_game_boards):
         """Test start_game with custom starting position"""
-        import server
-        
         sicilian_fen = sample_game_positions["sicilian"]
         result = server.start_game(fen=sicilian_fen)
         
         assert result["status"] == "Game started"
         # Compare normalized FEN (chess.Board normalizes en passant availability)
-        import chess
-        expected_board = chess.Board(sicilian_fen)
-        assert server.current_game.board.fen() == expected_board.fen(), "Board should be set to custom position"
+        assert server.current_game.board.fen() == sample_game_boards["sicilian"].fen(), "Board should be set to custom position"
     
-    @pytest.mark.asyncio
-    async def test_start_game_invalid_fen(self):
+    def test_start_game_invalid_fen(self):
         """Test start_game with invalid FEN"""
-        import server
-        
         result = server.start_game(fen="invalid_fen_string")
         
         assert "error" in result, "Invalid FEN should return error"
         assert "Invalid FEN string" in result["error"], "Error should mention invalid FEN"
     
-    @pytest.mark.asyncio 
-    async def test_record_opponent_move_success(self):
+    def test_record_opponent_move_success(self):
         """Test recording a valid opponent move"""
-        import server
-        
         # Start a game first
         server.start_game("black", 10)
         
@@ -228,11 +194,8 @@ class TestGameTools:
         assert len(server.current_game.move_history) == 1, "Move history should contain one move"
         assert server.current_game.move_history[0].uci() == "e2e4", "Move should be e2e4"
     
-    @pytest.mark.asyncio
-    async def test_record_opponent_move_no_game(self):
+    def test_record_opponent_move_no_game(self):
         """Test recording move when no game is active"""
-        import server
-        
         # Clear any existing game
         server.current_game = None
         
@@ -241,11 +204,8 @@ class TestGameTools:
         assert "error" in result, "Should return error when no game active"
         assert "No active game" in result["error"], "Error should mention no active game"
     
-    @pytest.mark.asyncio
-    async def test_record_opponent_move_invalid_uci(self):
+    def test_record_opponent_move_invalid_uci(self):
         """Test recording move with invalid UCI format"""
-        import server
-        
         # Start a game first
         server.start_game("black", 10)
         
@@ -254,11 +214,8 @@ class TestGameTools:
         assert "error" in result, "Invalid UCI should return error"
         assert "Invalid move" in result["error"], "Error should mention invalid move"
     
-    @pytest.mark.asyncio
-    async def test_record_opponent_move_illegal_move(self):
+    def test_record_opponent_move_illegal_move(self):
         """Test recording an illegal chess move"""
-        import server
-        
         # Start a game first  
         server.start_game("black", 10)
         
@@ -268,11 +225,8 @@ class TestGameTools:
         assert "error" in result, "Illegal move should return error"
         assert "Invalid move" in result["error"], "Error should mention invalid move"
     
-    @pytest.mark.asyncio
-    async def test_make_move_success(self):
+    def test_make_move_success(self):
         """Test making a valid AI move"""
-        import server
-        
         # Start a game first
         server.start_game("black", 10)
         
@@ -283,11 +237,27 @@ class TestGameTools:
         assert len(server.current_game.move_history) == 1, "Move history should contain one move"
         assert server.current_game.move_history[0].uci() == "e2e4", "Move should be e2e4"
     
-    @pytest.mark.asyncio
-    async def test_make_move_no_game(self):
-        """Test making move when no game is active"""
-        import server
+    def test_make_move_castling_notations(self):
+        """Test that both castling notations are accepted"""
+        for move in ("e1g1", "e1h1"):
+            server.start_game("black", 10, fen="r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+            result = server.make_move(move)
+            
+            assert result["status"] == "Move made", f"Castling as {move} should be legal"
+            assert server.current_game.board.piece_at(chess.G1) == chess.Piece(chess.KING, chess.WHITE)
+    
+    def test_make_move_illegal_after_move(self):
+        """Test that legality follows the position after each move"""
+        server.start_game("black", 10)
+        server.make_move("e2e4")
+        
+        result = server.make_move("e2e4")
         
+        assert "error" in result, "A move that was legal last ply should now be rejected"
+        assert server.make_move("e7e5")["status"] == "Move made"
+    
+    def test_make_move_no_game(self):
+        """Test making move when no game is active"""
         # Clear any existing game
         server.current_game = None
         
@@ -296,11 +266,8 @@ class TestGameTools:
         assert "error" in result, "Should return error when no game active"
         assert "No active game" in result["error"], "Error should mention no active game"
     
-    @pytest.mark.asyncio
-    async def test_get_game_status_success(self):
+    def test_get_game_status_success(self):
         """Test getting game status"""
-        import server
-        
         # Start a game and make some moves
         server.start_game("black", 10)
         server.record_opponent_move("e2e4")
@@ -319,11 +286,35 @@ class TestGameTools:
         assert result["move_history"] == ["e2e4", "e7e5"], "Move history should be in UCI format"
         assert result["ai_color"] == "black", "AI color should be black"
     
-    @pytest.mark.asyncio
-    async def test_get_game_status_no_game(self):
-        """Test getting game status when no game is active"""
-        import server
+    def test_get_game_status_tracks_moves(self):
+        """Test that the reported FEN follows the game after each move"""
+        server.start_game("black", 10)
+        initial_fen = server.get_game_status()["fen"]
+        server.record_opponent_move("e2e4")
+        
+        result = server.get_game_status()
+        
+        assert result["fen"] != initial_fen, "FEN should change after a move"
+        assert result["fen"] == server.current_game.board.fen(), "FEN should match the board"
+        assert result["move_history"] == ["e2e4"]
+    
+    @pytest.mark.parametrize("fen,is_checkmate,is_stalemate", [
+        ("R5k1/5ppp/8/8/8/8/8/6K1 b - - 0 1", True, False),
+        ("k7/8/1QK5/8/8/8/8/8 b - - 0 1", False, True),
+        ("7k/5B2/6K1/8/8/8/8/8 b - - 0 1", False, True),  # Stalemate with insufficient material
+    ])
+    def test_get_game_status_game_over(self, fen, is_checkmate, is_stalemate):
+        """Test game status flags for finished games"""
+        server.start_game("white", 10, fen=fen)
+        
+        result = server.get_game_status()
         
+        assert result["is_game_over"], "Game should be over"
+        assert result["is_checkmate"] == is_checkmate
+        assert result["is_stalemate"] == is_stalemate
+    
+    def test_get_game_status_no_game(self):
+        """Test getting game status when no game is active"""
         # Clear any existing game
         server.current_game = None
         
@@ -333,43 +324,31 @@ class TestGameTools:
         assert "No active game" in result["error"], "Error should mention no active game"
 
 
+@pytest.mark.usefixtures("patch_stockfish_manager")
 class TestToolIntegration:
     """Test integration between tools and components"""
     
-    @pytest.mark.asyncio
-    async def test_analysis_workflow(self, sample_game_positions, mock_manager):
+    def test_analysis_workflow(self, sample_game_positions, mock_manager):
         """Test complete analysis workflow"""
-        with patch('server.stockfish_manager', mock_manager):
-            import server
+        for position_name, fen in sample_game_positions.items():
+            # First validate the position
+            is_valid = server.fen_validator(fen)
+            assert is_valid, f"Position {position_name} should be valid"
             
-            for position_name, fen in sample_game_positions.items():
-                # First validate the position
-                is_valid = server.fen_validator(fen)
-                assert is_valid, f"Position {position_name} should be valid"
-                
-                # Then analyze it
-                analysis = server.analyze_position(fen)
-                best_move = server.get_best_move(fen)
-                
-                # Results should be consistent
-                assert analysis["best_move"] == best_move, f"Analysis and get_best_move should agree for {position_name}"
+            # Then analyze it
+            analysis = server.analyze_position(fen)
+            best_move = server.get_best_move(fen)
+            
+            # Results should be consistent
+            assert analysis["best_move"] == best_move, f"Analysis and get_best_move should agree for {position_name}"
     
-    @pytest.mark.asyncio
-    async def test_mock_manager_call_tracking(self, starting_position, mock_manager):
+    def test_mock_manager_call_tracking(self, starting_position, mock_manager):
         """Test that mock manager properly tracks calls"""
-        with patch('server.stockfish_manager', mock_manager):
-            import server
-            
-            mock_manager.reset_calls()
-            
-            # Make various calls
-            server.analyze_position(starting_position)
-            server.get_best_move(starting_position)
-            server.get_top_moves(starting_position, 3)
-            
-            # Verify calls were tracked
-            calls = mock_manager.engine_calls
-            assert len(calls) == 3, "Should track all three calls"
-            assert calls[0][0] == "analyze", "First call should be analyze"
-            assert calls[1][0] == "best_move", "Second call should be best_move"
-            assert calls[2][0] == "top_moves", "Third call should be top_moves"
\ No newline at end of file
+        # Make various calls
+        server.analyze_position(starting_position)
+        server.get_best_move(starting_position)
+        server.get_top_moves(starting_position, 3)
+        
+        # Verify calls were tracked
+        calls = [call[0] for call in mock_manager.engine_calls]
+        assert calls == EXPECTED_CALL_SEQUENCE, "Should track all three calls in order"
\ No newline at end of file